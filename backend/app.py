@@ -1,12 +1,23 @@
-from flask import Flask, request, jsonify, send_file, render_template, redirect
+from flask import Flask, request, jsonify, render_template, redirect, Response, stream_with_context
+from flask.json.provider import JSONProvider, DefaultJSONProvider
 from flask_cors import CORS
+from flask_compress import Compress
 import firebase_admin
 from firebase_admin import credentials, db
 import os
-import json
-from io import BytesIO
-from services.export_service import ExportService
-from services.auth_service import AuthService, require_auth
+import hashlib
+import multiprocessing
+import orjson
+import secrets
+import threading
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from urllib.parse import quote
+from services.export_service import ExportService, render_pdf
+from services.auth_service import get_auth_service, require_auth
 from services.csv_service import CSVService
 from services.graph_service import GraphService
 
@@ -22,13 +33,82 @@ app = Flask(__name__,
             template_folder='../templates')
 CORS(app)  # Enable CORS for frontend access
 
+# Gzip text responses (graph images arrive as base64 inside JSON)
+app.config['COMPRESS_MIMETYPES'] = ['application/json', 'text/html', 'text/csv', 'text/markdown']
+app.config['COMPRESS_ALGORITHM'] = ['gzip', 'deflate']
+app.config['COMPRESS_LEVEL'] = 4
+app.config['COMPRESS_DEFLATE_LEVEL'] = 4
+# Compressing a streamed response would buffer the whole body first, which
+# defeats streaming the CSV export
+app.config['COMPRESS_STREAMS'] = False
+Compress(app)
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider that encodes/decodes request and response bodies with orjson"""
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=DefaultJSONProvider.default, option=self.option).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response, skipping the str round trip
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=DefaultJSONProvider.default, option=self.option)
+        return self._app.response_class(body, mimetype='application/json')
+
+app.json = OrjsonProvider(app)
+
+def matching_etag(etag):
+    """
+    Return the If-None-Match validator that matches etag, or None
+    
+    If-None-Match uses weak comparison, so W/ validators (e.g. from a
+    gzipping proxy) match too. The ':<algorithm>' suffix Flask-Compress adds
+    is ignored when comparing. Flask-Compress doesn't touch 304s, so they
+    should carry the validator the client sent back, suffix included.
+    """
+    if request.if_none_match.star_tag:
+        return etag
+    for tag in request.if_none_match.as_set(include_weak=True):
+        if tag.split(':')[0] == etag:
+            return tag
+    return None
+
+# Landing/auth pages are small and static, so keep them in memory with an ETag
+STATIC_PAGES = {}
+
+def static_page(filename):
+    page = None if app.debug else STATIC_PAGES.get(filename)
+    if page is None:
+        with open(os.path.join(app.root_path, '..', filename), 'rb') as f:
+            body = f.read()
+        page = (body, hashlib.md5(body, usedforsecurity=False).hexdigest())
+        STATIC_PAGES[filename] = page
+    
+    body, etag = page
+    client_etag = matching_etag(etag)
+    if client_etag:
+        response = Response(status=304)
+        response.set_etag(client_etag, weak=request.if_none_match.is_weak(client_etag))
+    else:
+        response = Response(body, mimetype='text/html')
+        response.set_etag(etag)
+    # In debug the page is re-read every request, so let edits show up
+    if not app.debug:
+        response.cache_control.public = True
+        response.cache_control.max_age = 300
+    return response
+
 @app.route('/')
 def home():
-    return send_file('../landing.html')
+    return static_page('landing.html')
 
 @app.route('/auth')
 def auth_page():
-    return send_file('../auth.html')
+    return static_page('auth.html')
 
 # ============================================================================
 # APP ROUTES (MPA)
@@ -61,6 +141,27 @@ def view_help():
 def view_workspaces():
     return render_template('workspaces.html', page='workspaces')
 
+APP_TEMPLATES = (
+    'layout.html',
+    'workspace.html',
+    'team.html',
+    'settings.html',
+    'profile.html',
+    'help.html',
+    'workspaces.html'
+)
+
+# Compile the MPA templates up front so the first request doesn't pay for it.
+# A missing or broken template only breaks its own route, not startup
+def warm_templates():
+    for template in APP_TEMPLATES:
+        try:
+            app.jinja_env.get_template(template)
+        except Exception as e:
+            print(f'⚠️  Could not precompile template {template}: {e}')
+
+warm_templates()
+
 # Initialize Firebase Admin SDK
 def init_firebase():
     try:
@@ -80,10 +181,23 @@ init_firebase()
 
 # Initialize services
 export_service = ExportService()
-auth_service = AuthService()
+auth_service = get_auth_service()
 csv_service = CSVService()
 graph_service = GraphService()
 
+# HistoryService is imported on first use so the app still starts without it
+_history_service = None
+_history_service_lock = threading.Lock()
+
+def get_history_service():
+    """Return the process-wide HistoryService, importing it on the first history request"""
+    global _history_service
+    with _history_service_lock:
+        if _history_service is None:
+            from services.history_service import HistoryService
+            _history_service = HistoryService()
+    return _history_service
+
 
 # ============================================================================
 # AUTHENTICATION ENDPOINTS
@@ -109,8 +223,8 @@ def verify_token():
             decoded.get('email', '')
         )
         
-        # Get user info
-        user_info = auth_service.get_user_info(decoded['uid'])
+        # The signed token already carries the profile claims, no need for auth.get_user
+        user_info = auth_service.get_user_info_from_token(decoded)
         
         return jsonify({
             'sessionToken': session_token,
@@ -204,13 +318,12 @@ def export_csv():
     """Export data to CSV"""
     try:
         data = request.json
-        csv_bytes = csv_service.export_to_csv(data)
+        chunks = csv_service.iter_csv(data)
         
-        return send_file(
-            BytesIO(csv_bytes),
+        return Response(
+            stream_with_context(chunks),
             mimetype='text/csv',
-            as_attachment=True,
-            download_name='export.csv'
+            headers={'Content-Disposition': 'attachment; filename=export.csv'}
         )
         
     except Exception as e:
@@ -242,9 +355,7 @@ def validate_csv():
 @require_auth
 def get_history(workspace_id):
     try:
-        from services.history_service import HistoryService
-        history_service = HistoryService()
-        history = history_service.get_history(workspace_id)
+        history = get_history_service().get_history(workspace_id)
         return jsonify(history)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -253,10 +364,10 @@ def get_history(workspace_id):
 @require_auth
 def restore_version(workspace_id, snapshot_id):
     try:
-        from services.history_service import HistoryService
-        history_service = HistoryService()
-        success = history_service.restore_version(workspace_id, snapshot_id)
+        success = get_history_service().restore_version(workspace_id, snapshot_id)
         if success:
+             # The restore rewrites the workspace, so refresh its ETag
+             db.reference(f'workspaces/{workspace_id}/updatedAt').set({'.sv': 'timestamp'})
              return jsonify({'success': True})
         return jsonify({'error': 'Failed to restore'}), 400
     except Exception as e:
@@ -266,7 +377,6 @@ def restore_version(workspace_id, snapshot_id):
 @require_auth
 def save_snapshot(workspace_id):
     try:
-        from services.history_service import HistoryService
         data = request.json
         content = data.get('content')
         user_id = data.get('userId') # Or use request.user['uid']
@@ -274,8 +384,7 @@ def save_snapshot(workspace_id):
         if not content:
              return jsonify({'error': 'Content required'}), 400
              
-        history_service = HistoryService()
-        snap_id = history_service.save_snapshot(workspace_id, content, user_id)
+        snap_id = get_history_service().save_snapshot(workspace_id, content, user_id)
         return jsonify({'snapshotId': snap_id})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -287,6 +396,65 @@ def save_snapshot(workspace_id):
 # EXPORT ENDPOINTS
 # ============================================================================
 
+# PDF rendering is CPU-bound, so it runs in worker processes instead of
+# holding the GIL on the request thread. Every Gunicorn worker gets its own
+# pool, so keep it small (EXPORT_WORKERS, default 1)
+_export_pool = None
+_export_pool_lock = threading.Lock()
+
+def get_export_pool():
+    """
+    Return this process's export pool
+    
+    Unlike the service getters, the pool can be replaced: discard_export_pool
+    drops it after a worker crash and the next call builds a new one.
+    """
+    global _export_pool
+    with _export_pool_lock:
+        if _export_pool is None:
+            _export_pool = ProcessPoolExecutor(
+                max_workers=int(os.getenv('EXPORT_WORKERS', 1)),
+                # Forking a process that already runs threads is unsafe
+                mp_context=multiprocessing.get_context('spawn')
+            )
+    return _export_pool
+
+def discard_export_pool(pool):
+    """Drop a broken pool so the next call builds a fresh one"""
+    global _export_pool
+    with _export_pool_lock:
+        # Another thread may already have replaced it
+        if _export_pool is pool:
+            _export_pool = None
+    pool.shutdown(wait=False)
+
+def run_export(fn, *args):
+    """Run fn in the export pool, rebuilding it once if a worker died"""
+    for attempt in range(2):
+        pool = get_export_pool()
+        try:
+            return pool.submit(fn, *args).result()
+        except BrokenProcessPool:
+            # A crashed worker (OOM kill, native crash) breaks the whole pool
+            discard_export_pool(pool)
+            if attempt:
+                raise
+
+def send_attachment(body, mimetype, download_name):
+    """Send in-memory bytes as a download without wrapping them in a file object"""
+    try:
+        download_name.encode('ascii')
+    except UnicodeEncodeError:
+        # Same RFC 5987 fallback that send_file uses for non-ASCII names
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        names = {'filename': simple, 'filename*': f"UTF-8''{quote(download_name, safe='!#$&+-.^_`|~')}"}
+    else:
+        names = {'filename': download_name}
+    
+    response = Response(body, mimetype=mimetype)
+    response.headers.set('Content-Disposition', 'attachment', **names)
+    return response
+
 @app.route('/api/export/document', methods=['POST'])
 @require_auth
 def export_document():
@@ -298,40 +466,21 @@ def export_document():
         title = data.get('title', 'Untitled Document')
         
         if export_format == 'pdf':
-            pdf_bytes = export_service.export_to_pdf(content, title)
-            return send_file(
-                BytesIO(pdf_bytes),
-                mimetype='application/pdf',
-                as_attachment=True,
-                download_name=f'{title}.pdf'
-            )
+            pdf_bytes = run_export(render_pdf, content, title)
+            return send_attachment(pdf_bytes, 'application/pdf', f'{title}.pdf')
         
         elif export_format == 'markdown':
             markdown_text = export_service.export_to_markdown(content)
-            return send_file(
-                BytesIO(markdown_text.encode('utf-8')),
-                mimetype='text/markdown',
-                as_attachment=True,
-                download_name=f'{title}.md'
-            )
+            return send_attachment(markdown_text.encode('utf-8'), 'text/markdown', f'{title}.md')
         
         elif export_format == 'html':
             html_text = export_service.export_to_html(content, title)
-            return send_file(
-                BytesIO(html_text.encode('utf-8')),
-                mimetype='text/html',
-                as_attachment=True,
-                download_name=f'{title}.html'
-            )
+            return send_attachment(html_text.encode('utf-8'), 'text/html', f'{title}.html')
         
         elif export_format == 'json':
-            json_data = json.dumps(content, indent=4)
-            return send_file(
-                BytesIO(json_data.encode('utf-8')),
-                mimetype='application/json',
-                as_attachment=True,
-                download_name=f'{title}.json'
-            )
+            # orjson encodes straight to UTF-8 bytes in one pass
+            json_bytes = orjson.dumps(content, option=orjson.OPT_INDENT_2)
+            return send_attachment(json_bytes, 'application/json', f'{title}.json')
         
         else:
             return jsonify({'error': 'Unsupported format'}), 400
@@ -351,13 +500,30 @@ def get_workspace(workspace_id):
         if not firebase_admin._apps:
             return jsonify({'error': 'Firebase not initialized'}), 500
         
-        ref = db.reference(f'workspaces/{workspace_id}')
-        data = ref.get()
-        
-        return jsonify({
-            'workspaceId': workspace_id,
-            'data': data
-        })
+        # Workspaces record updatedAt on every change, so check it before
+        # downloading the whole tree
+        updated_at = db.reference(f'workspaces/{workspace_id}/updatedAt').get()
+        etag = str(updated_at) if updated_at is not None else None
+        client_etag = matching_etag(etag) if etag else None
+        if client_etag:
+            response = Response(status=304)
+            response.set_etag(client_etag, weak=request.if_none_match.is_weak(client_etag))
+        else:
+            ref = db.reference(f'workspaces/{workspace_id}')
+            data = ref.get()
+            
+            response = jsonify({
+                'workspaceId': workspace_id,
+                'data': data
+            })
+            if etag:
+                response.set_etag(etag)
+        
+        if etag:
+            # Clients must revalidate, and shared caches must not store it
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+        return response
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -394,6 +560,61 @@ def internal_error(error):
     return jsonify({'error': 'Internal server error'}), 500
 
 
+# ============================================================================
+# FIREBASE HELPERS
+# ============================================================================
+
+PUSH_CHARS = '-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz'
+_push_lock = threading.Lock()
+_last_push_time = 0
+_last_push_rand = [0] * 12
+
+def generate_push_id():
+    """Generate a Firebase push key locally, like the client SDK's push().key"""
+    global _last_push_time
+    with _push_lock:
+        now = int(time.time() * 1000)
+        if now == _last_push_time:
+            # Same millisecond: bump the random part so keys stay ordered
+            i = 11
+            while i >= 0 and _last_push_rand[i] == 63:
+                _last_push_rand[i] = 0
+                i -= 1
+            if i >= 0:
+                _last_push_rand[i] += 1
+        else:
+            _last_push_time = now
+            _last_push_rand[:] = [secrets.randbelow(64) for _ in range(12)]
+        rand = list(_last_push_rand)
+    
+    time_chars = []
+    for _ in range(8):
+        time_chars.append(PUSH_CHARS[now % 64])
+        now //= 64
+    return ''.join(reversed(time_chars)) + ''.join(PUSH_CHARS[c] for c in rand)
+
+# '.' -> ',' matches firebase-service.js; other characters RTDB rejects in keys
+# are percent-encoded so distinct addresses never share a key
+_EMAIL_KEY_TABLE = str.maketrans({
+    '.': ',', '%': '%25', '$': '%24', '#': '%23', '[': '%5B', ']': '%5D', '/': '%2F'
+})
+
+@lru_cache(maxsize=4096)
+def email_key(email):
+    """
+    Key under which an email's invites are stored
+    
+    Keep in sync with emailKey in firebase-service.js and the invites read
+    rule in README.md (Firebase Rules).
+    """
+    return email.translate(_EMAIL_KEY_TABLE)
+
+@lru_cache(maxsize=1024)
+def get_workspace_name(workspace_id):
+    """Workspace names are read often and rarely change, so keep them in-process"""
+    return db.reference(f'workspaces/{workspace_id}/name').get()
+
+
 # ============================================================================
 # TEAM ENDPOINTS
 # ============================================================================
@@ -409,30 +630,33 @@ def invite_member():
         if not email or not workspace_id:
             return jsonify({'error': 'Email and Workspace ID required'}), 400
             
-        # 1. Save to Workspace node
-        inv_ref = db.reference(f'workspaces/{workspace_id}/invites')
-        new_invite = inv_ref.push({
-            'email': email, 
-            'status': 'pending', 
-            'invitedBy': request.user.get('uid'),
-            'timestamp': {'.sv': 'timestamp'}
-        })
-        
-        # 2. Save to Global Invites node (indexed by email) for the target user to find
-        safe_email = email.replace('.', ',')
-        user_inv_ref = db.reference(f'invites/{safe_email}')
-        user_inv_ref.child(new_invite.key).set({
-            'workspaceId': workspace_id,
-            'workspaceName': db.reference(f'workspaces/{workspace_id}/name').get() or "Unnamed Workspace",
-            'invitedBy': request.user.get('uid'),
-            'status': 'pending',
-            'timestamp': {'.sv': 'timestamp'}
+        invite_id = generate_push_id()
+        safe_email = email_key(email)
+        
+        # Write both invite nodes in a single multi-location update
+        db.reference('/').update({
+            # 1. Workspace node
+            f'workspaces/{workspace_id}/invites/{invite_id}': {
+                'email': email, 
+                'status': 'pending', 
+                'invitedBy': request.user.get('uid'),
+                'timestamp': {'.sv': 'timestamp'}
+            },
+            # 2. Global Invites node (indexed by email) for the target user to find
+            f'invites/{safe_email}/{invite_id}': {
+                'workspaceId': workspace_id,
+                'workspaceName': get_workspace_name(workspace_id) or "Unnamed Workspace",
+                'invitedBy': request.user.get('uid'),
+                'status': 'pending',
+                'timestamp': {'.sv': 'timestamp'}
+            },
+            f'workspaces/{workspace_id}/updatedAt': {'.sv': 'timestamp'}
         })
         
         return jsonify({
             'success': True, 
             'message': f'Invite sent to {email}',
-            'inviteId': new_invite.key
+            'inviteId': invite_id
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -446,7 +670,7 @@ def get_user_invites():
         if not user_email:
             return jsonify({'invites': []})
             
-        safe_email = user_email.replace('.', ',')
+        safe_email = email_key(user_email)
         invites = db.reference(f'invites/{safe_email}').get()
         
         if not invites:
@@ -471,19 +695,28 @@ def respond_to_invite():
         if not invite_id or not action or not workspace_id:
              return jsonify({'error': 'Missing required fields'}), 400
              
-        safe_email = user_email.replace('.', ',')
+        safe_email = email_key(user_email)
+        
+        status = 'accepted' if action == 'accept' else 'rejected'
         
+        updates = {
+            # Update invite status in workspace and in global invites
+            f'workspaces/{workspace_id}/invites/{invite_id}/status': status,
+            f'invites/{safe_email}/{invite_id}/status': status,
+            f'workspaces/{workspace_id}/updatedAt': {'.sv': 'timestamp'}
+        }
         if action == 'accept':
-            # 1. Add user to workspace members
-            db.reference(f'workspaces/{workspace_id}/members').update({uid: 'member'})
-            # 2. Update invite status in workspace
-            db.reference(f'workspaces/{workspace_id}/invites/{invite_id}').update({'status': 'accepted'})
-            # 3. Update invite status in global invites
-            db.reference(f'invites/{safe_email}/{invite_id}').update({'status': 'accepted'})
-        else:
-            # Update status to rejected
-            db.reference(f'workspaces/{workspace_id}/invites/{invite_id}').update({'status': 'rejected'})
-            db.reference(f'invites/{safe_email}/{invite_id}').update({'status': 'rejected'})
+            # Add user to workspace members
+            updates[f'workspaces/{workspace_id}/members/{uid}'] = 'member'
+            # Add workspace to the user's workspace index
+            updates[f'users/{uid}/workspaces/{workspace_id}'] = {
+                'role': 'member',
+                'name': get_workspace_name(workspace_id) or 'Unnamed',
+                'joinedAt': {'.sv': 'timestamp'}
+            }
+        
+        # One multi-location update instead of a round trip per node
+        db.reference('/').update(updates)
             
         return jsonify({'success': True})
     except Exception as e:
@@ -495,20 +728,33 @@ def list_workspaces():
     """List all workspaces the user is a member of"""
     try:
         uid = request.user.get('uid') or request.user.get('user_id')
-        # This is a bit slow in RTDB (scanning all workspaces)
-        # In a real app, we'd have a /users/{uid}/workspaces list
-        all_workspaces = db.reference('workspaces').get()
-        
-        user_workspaces = []
-        if all_workspaces:
-            for wid, wdata in all_workspaces.items():
-                members = wdata.get('members', {})
-                if uid in members:
-                    user_workspaces.append({
-                        'id': wid,
-                        'name': wdata.get('name', 'Unnamed'),
-                        'role': members[uid]
-                    })
+        # Read the user's own index instead of scanning all workspaces
+        user_ref = db.reference(f'users/{uid}')
+        user_data = user_ref.get() or {}
+        index = user_data.get('workspaces') or {}
+        
+        if not user_data.get('workspacesIndexed'):
+            # Workspaces joined before the index existed may be missing from
+            # it: scan once, merge them in and mark the index as complete
+            updates = {'workspacesIndexed': True}
+            all_workspaces = db.reference('workspaces').get()
+            if all_workspaces:
+                for wid, wdata in all_workspaces.items():
+                    members = wdata.get('members', {})
+                    if uid in members and wid not in index:
+                        index[wid] = {
+                            'role': members[uid],
+                            'name': wdata.get('name', 'Unnamed')
+                        }
+                        updates[f'workspaces/{wid}'] = index[wid]
+            # Multi-path update leaves entries written meanwhile untouched
+            user_ref.update(updates)
+        
+        user_workspaces = [{
+            'id': wid,
+            'name': entry.get('name', 'Unnamed'),
+            'role': entry.get('role')
+        } for wid, entry in index.items()]
         
         return jsonify({'workspaces': user_workspaces})
     except Exception as e:
@@ -527,7 +773,15 @@ def create_workspace():
             'name': name,
             'owner': uid,
             'members': {uid: 'owner'},
-            'createdAt': {'.sv': 'timestamp'}
+            'createdAt': {'.sv': 'timestamp'},
+            'updatedAt': {'.sv': 'timestamp'}
+        })
+        
+        # Keep the user's workspace index in sync
+        db.reference(f'users/{uid}/workspaces/{workspace_ref.key}').set({
+            'role': 'owner',
+            'name': name,
+            'joinedAt': {'.sv': 'timestamp'}
         })
         
         return jsonify({
@@ -550,6 +804,17 @@ def process_graph():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/graphs/png', methods=['POST'])
+@require_auth
+def graph_png():
+    """Return the Matplotlib image as a raw PNG (no base64 data URI)"""
+    try:
+        data = request.json
+        png_bytes = graph_service.generate_matplotlib_plot_bytes(data)
+        return Response(png_bytes, mimetype='image/png')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
     print('🚀 Starting Notion Clone Backend Server...')
     print('📡 Server running on http://localhost:5000')
@@ -566,5 +831,9 @@ if __name__ == '__main__':
     print('     - POST /api/export/document')
     print('   Workspace:')
     print('     - GET  /api/workspace/<id>')
+    print('   Graphs:')
+    print('     - POST /api/graphs/process')
+    print('     - POST /api/graphs/png')
     print('')
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Development server only; use `gunicorn wsgi:application` in production
+    app.run(debug=os.getenv('FLASK_DEBUG', '1') == '1', host='0.0.0.0', port=5000)
@@ -0,0 +1,18 @@
+"""
+Gunicorn configuration
+Loaded automatically when gunicorn is started from the backend folder
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+
+# Threaded workers overlap the Firebase round trips, which are I/O-bound
+worker_class = 'gthread'
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+
+# Each worker also starts its own PDF export pool of EXPORT_WORKERS processes
+# (default 1), so render processes total workers * EXPORT_WORKERS
+
+timeout = 60
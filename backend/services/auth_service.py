@@ -5,19 +5,70 @@ Handles Firebase token verification and user session management
 from firebase_admin import auth
 from functools import wraps
 from flask import request, jsonify
+from collections import OrderedDict
+import hashlib
+import threading
+import time
 import jwt
 import os
 from datetime import datetime, timedelta
 
+# Verified tokens are reused for at most this many seconds (never past their exp)
+TOKEN_CACHE_TTL = 300
+TOKEN_CACHE_MAXSIZE = 10_000
+
+
+class _TokenCache:
+    """Thread-safe LRU cache of verified token payloads"""
+    
+    def __init__(self, maxsize=TOKEN_CACHE_MAXSIZE, ttl=TOKEN_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _key(self, token):
+        return hashlib.blake2b(token.encode('utf-8'), digest_size=16).digest()
+    
+    def get(self, token):
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, payload = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return dict(payload)
+    
+    def set(self, token, payload):
+        expires_at = time.time() + self.ttl
+        if payload.get('exp'):
+            expires_at = min(expires_at, payload['exp'])
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (expires_at, dict(payload))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
 
 class AuthService:
     def __init__(self):
         self.secret_key = os.getenv('JWT_SECRET_KEY', 'your-secret-key-change-this')
+        self._firebase_cache = _TokenCache()
+        self._session_cache = _TokenCache()
     
     def verify_firebase_token(self, id_token):
         """Verify Firebase ID token"""
+        cached = self._firebase_cache.get(id_token)
+        if cached is not None:
+            return cached
         try:
             decoded_token = auth.verify_id_token(id_token)
+            self._firebase_cache.set(id_token, decoded_token)
             return decoded_token
         except Exception as e:
             print(f'Token verification error: {e}')
@@ -34,8 +85,12 @@ class AuthService:
     
     def verify_session_token(self, token):
         """Verify session JWT token"""
+        cached = self._session_cache.get(token)
+        if cached is not None:
+            return cached
         try:
             payload = jwt.decode(token, self.secret_key, algorithms=['HS256'])
+            self._session_cache.set(token, payload)
             return payload
         except jwt.ExpiredSignatureError:
             return None
@@ -57,6 +112,16 @@ class AuthService:
             print(f'Error getting user info: {e}')
             return None
 
+    def get_user_info_from_token(self, decoded_token):
+        """Build user information from verified Firebase ID token claims"""
+        return {
+            'uid': decoded_token['uid'],
+            'email': decoded_token.get('email'),
+            'displayName': decoded_token.get('name'),
+            'photoURL': decoded_token.get('picture'),
+            'emailVerified': decoded_token.get('email_verified', False)
+        }
+
     def update_user(self, uid, **kwargs):
         """Update user profile"""
         try:
@@ -79,6 +144,24 @@ class AuthService:
             raise e
 
 
+_auth_service = None
+_auth_service_lock = threading.Lock()
+
+
+def get_auth_service():
+    """
+    Return the process-wide AuthService
+    
+    One instance is shared so its token cache is reused across requests.
+    The lock keeps concurrent first requests from each building their own.
+    """
+    global _auth_service
+    with _auth_service_lock:
+        if _auth_service is None:
+            _auth_service = AuthService()
+    return _auth_service
+
+
 def require_auth(f):
     """Decorator to require authentication for endpoints"""
     @wraps(f)
@@ -91,7 +174,7 @@ def require_auth(f):
         try:
             # Extract token from "Bearer <token>"
             token = auth_header.split(' ')[1]
-            auth_service = AuthService()
+            auth_service = get_auth_service()
             
             # Try Firebase token first
             decoded = auth_service.verify_firebase_token(token)
@@ -2,10 +2,27 @@
 CSV Import/Export Service
 Handles CSV file processing for database blocks
 """
+import numpy as np
 import pandas as pd
 import io
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional
+
+# Rows encoded per chunk when streaming CSV exports
+EXPORT_CHUNK_ROWS = 10_000
+
+# Bytes compared per step when counting lines, bounding the temporary mask
+LINE_COUNT_BLOCK_SIZE = 1 << 20
+
+# Bytes a line may start with when pandas could skip it as blank
+_BLANK_LINE_START = np.zeros(256, dtype=bool)
+_BLANK_LINE_START[[0x09, 0x0A, 0x0D, 0x20]] = True
+
+# Uploads up to this size are validated with a single full parse
+FULL_PARSE_MAX_BYTES = 1_000_000
+
+# Rows parsed per chunk when counting rows of large quoted CSVs
+ROW_COUNT_CHUNK_ROWS = 100_000
 
 
 class CSVService:
@@ -28,15 +45,12 @@ class CSVService:
             # Get column names
             columns = df.columns.tolist()
             
+            # Clean NaN values in one vectorized pass
+            df = df.astype(object).where(df.notna(), '')
+            
             # Convert to list of dictionaries
             rows = df.to_dict('records')
             
-            # Clean NaN values
-            for row in rows:
-                for key in row:
-                    if pd.isna(row[key]):
-                        row[key] = ''
-            
             return {
                 'success': True,
                 'columns': columns,
@@ -61,37 +75,66 @@ class CSVService:
         Returns:
             CSV file bytes
         """
+        return b''.join(self.iter_csv(data))
+    
+    def iter_csv(self, data: Dict[str, Any], chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[bytes]:
+        """
+        Export database block to CSV in chunks, for streaming responses
+        
+        Args:
+            data: Dictionary with 'columns' and 'rows'
+            chunk_rows: Number of rows encoded per chunk
+            
+        Returns:
+            Iterator of UTF-8 encoded CSV chunks
+        """
         try:
             columns = data.get('columns', [])
             rows = data.get('rows', [])
             
-            # Create DataFrame
+            # Create DataFrame up front so bad input fails before streaming starts
             df = pd.DataFrame(rows, columns=columns)
             
-            # Convert to CSV
-            csv_buffer = io.StringIO()
-            df.to_csv(csv_buffer, index=False)
-            
-            return csv_buffer.getvalue().encode('utf-8')
-            
         except Exception as e:
             raise Exception(f'CSV export failed: {e}')
+        
+        return self._iter_csv_chunks(df, chunk_rows)
+    
+    def _iter_csv_chunks(self, df: pd.DataFrame, chunk_rows: int) -> Iterator[bytes]:
+        """Yield the DataFrame as CSV, one block of rows at a time"""
+        if df.empty:
+            yield df.to_csv(index=False).encode('utf-8')
+            return
+        
+        for start in range(0, len(df), chunk_rows):
+            chunk = df.iloc[start:start + chunk_rows]
+            yield chunk.to_csv(index=False, header=(start == 0)).encode('utf-8')
     
     def validate_csv(self, file_content: bytes) -> Dict[str, Any]:
         """
         Validate CSV file structure
         
+        Args:
+            file_content: CSV file bytes
+            
         Returns:
             Validation result with preview
         """
         try:
-            df = pd.read_csv(io.BytesIO(file_content), nrows=5)
+            if len(file_content) <= FULL_PARSE_MAX_BYTES:
+                # Small files: one parse gives both the preview and an exact count
+                df = pd.read_csv(io.BytesIO(file_content))
+                estimated_rows = len(df)
+                df = df.head(5)
+            else:
+                df = pd.read_csv(io.BytesIO(file_content), nrows=5)
+                estimated_rows = self._estimate_rows(file_content)
             
             return {
                 'valid': True,
                 'columns': df.columns.tolist(),
                 'preview': df.to_dict('records'),
-                'estimatedRows': len(pd.read_csv(io.BytesIO(file_content)))
+                'estimatedRows': estimated_rows
             }
             
         except Exception as e:
@@ -99,3 +142,47 @@ class CSVService:
                 'valid': False,
                 'error': str(e)
             }
+    
+    def _estimate_rows(self, file_content: bytes) -> int:
+        """Count data rows in a large CSV without materializing a DataFrame"""
+        # Newlines only match pandas' row count when nothing is quoted (quoted
+        # fields may contain line breaks) and there are no blank lines to skip
+        line_count = None if b'"' in file_content else self._count_lines(file_content)
+        if line_count is not None:
+            # Like the parses, the first line is the header
+            return max(0, line_count - 1)
+        
+        # Otherwise stream the parse in chunks
+        reader = pd.read_csv(io.BytesIO(file_content), usecols=[0], dtype=str,
+                             chunksize=ROW_COUNT_CHUNK_ROWS)
+        return sum(len(chunk) for chunk in reader)
+    
+    def _count_lines(self, file_content: bytes) -> Optional[int]:
+        """
+        Count lines from line breaks instead of parsing the whole file
+        
+        Returns None when a line may be blank (it starts with whitespace or a
+        line break) or a bare CR ends a line, since pandas counts those
+        differently.
+        """
+        data = np.frombuffer(file_content, dtype=np.uint8)
+        if data.size and _BLANK_LINE_START[data[0]]:
+            return None
+        
+        # Vectorized newline count, one block at a time
+        line_count = 0
+        for start in range(0, data.size, LINE_COUNT_BLOCK_SIZE):
+            block = data[start:start + LINE_COUNT_BLOCK_SIZE]
+            
+            newlines = np.flatnonzero(block == 0x0A) + (start + 1)
+            line_count += newlines.size
+            if _BLANK_LINE_START[data[newlines[newlines < data.size]]].any():
+                return None
+            
+            returns = np.flatnonzero(block == 0x0D) + (start + 1)
+            if returns.size and (returns[-1] == data.size or (data[returns] != 0x0A).any()):
+                return None
+        
+        if data.size and data[-1] != 0x0A:
+            line_count += 1
+        return line_count
@@ -1,44 +1,103 @@
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.enums import TA_LEFT, TA_CENTER
+# reportlab and PIL are imported where they are used so that loading the
+# app (which only renders PDFs in worker processes) doesn't pay for them
 from io import BytesIO
-import base64
-from PIL import Image
+from html import escape, unescape
+import re
+import struct
+import pybase64 as b64  # SIMD-accelerated, same API as the stdlib module
+
+_TAG_RE = re.compile(r'<[^>]+>')
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Line prefix for each heading block type in Markdown exports
+_MARKDOWN_PREFIXES = {
+    'h1': '# ',
+    'h2': '## ',
+    'h3': '### ',
+}
+
+# Opening/closing markup for each block type in HTML exports
+_HTML_BLOCK_TAGS = {
+    'h1': ('    <h1>', '</h1>\n'),
+    'h2': ('    <h2>', '</h2>\n'),
+    'h3': ('    <h3>', '</h3>\n'),
+    'p': ('    <p>', '</p>\n'),
+}
+
+_process_export_service = None
+
+def render_pdf(content, title='Document'):
+    """
+    Export document content to PDF from a worker process
+    
+    Keeps one ExportService per process so styles are only set up once.
+    """
+    global _process_export_service
+    if _process_export_service is None:
+        _process_export_service = ExportService()
+    return _process_export_service.export_to_pdf(content, title)
 
 class ExportService:
     """Service for exporting documents and canvas to various formats"""
     
     def __init__(self):
-        self.styles = getSampleStyleSheet()
-        self._setup_custom_styles()
+        # Styles are built on first PDF export
+        self._styles = None
+        self._block_styles = None
+    
+    @property
+    def styles(self):
+        if self._styles is None:
+            self._setup_custom_styles()
+        return self._styles
     
     def _setup_custom_styles(self):
         """Setup custom paragraph styles"""
-        self.styles.add(ParagraphStyle(
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.lib.enums import TA_CENTER
+        
+        styles = getSampleStyleSheet()
+        styles.add(ParagraphStyle(
+            name='CustomTitle',
+            parent=styles['Title'],
+            fontSize=28,
+            textColor='#8b5cf6',
+            spaceAfter=20,
+            alignment=TA_CENTER
+        ))
+        
+        styles.add(ParagraphStyle(
             name='CustomH1',
-            parent=self.styles['Heading1'],
+            parent=styles['Heading1'],
             fontSize=24,
             spaceAfter=12,
             textColor='#1a1a24'
         ))
         
-        self.styles.add(ParagraphStyle(
+        styles.add(ParagraphStyle(
             name='CustomH2',
-            parent=self.styles['Heading2'],
+            parent=styles['Heading2'],
             fontSize=18,
             spaceAfter=10,
             textColor='#1a1a24'
         ))
         
-        self.styles.add(ParagraphStyle(
+        styles.add(ParagraphStyle(
             name='CustomH3',
-            parent=self.styles['Heading3'],
+            parent=styles['Heading3'],
             fontSize=14,
             spaceAfter=8,
             textColor='#1a1a24'
         ))
+        
+        # Paragraph style per block type; anything else is body text
+        self._block_styles = {
+            'h1': styles['CustomH1'],
+            'h2': styles['CustomH2'],
+            'h3': styles['CustomH3'],
+        }
+        self._styles = styles
     
     def export_to_pdf(self, content, title='Document'):
         """
@@ -51,6 +110,12 @@ class ExportService:
         Returns:
             bytes: PDF file content
         """
+        from reportlab.lib.pagesizes import letter
+        from reportlab.lib.units import inch
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+        from reportlab.platypus import Image as RLImage
+        
+        styles = self.styles
         buffer = BytesIO()
         doc = SimpleDocTemplate(buffer, pagesize=letter,
                               rightMargin=72, leftMargin=72,
@@ -59,69 +124,54 @@ class ExportService:
         story = []
         
         # Add title
-        title_style = ParagraphStyle(
-            'Title',
-            parent=self.styles['Title'],
-            fontSize=28,
-            textColor='#8b5cf6',
-            spaceAfter=20,
-            alignment=TA_CENTER
-        )
-        story.append(Paragraph(title, title_style))
+        story.append(Paragraph(title, styles['CustomTitle']))
         story.append(Spacer(1, 0.2 * inch))
         
         # Process blocks
         blocks = content.get('blocks', [])
         
+        # Local bindings for the per-block loop
+        append = story.append
+        clean = self._clean_html
+        block_styles = self._block_styles
+        body_style = styles['BodyText']
+        block_spacer = 0.1 * inch
+        
         for block in blocks:
             block_type = block.get('type', 'p')
-            text = block.get('text', '').strip()
             
             # Handle Graph/Image Blocks
             if block_type == 'graph':
                 img_data = block.get('content', '')
                 if img_data:
                     try:
-                        # Clean base64 string
-                        if 'base64,' in img_data:
-                            img_data = img_data.split('base64,')[1]
+                        # Clean base64 string, slicing the payload out only once
+                        offset = img_data.find('base64,')
+                        if offset != -1:
+                            img_data = img_data[offset + 7:]
                         
-                        img_bytes = base64.b64decode(img_data)
-                        img_buffer = BytesIO(img_bytes)
-                        img = Image.open(img_buffer)
+                        img_bytes = b64.b64decode(img_data, validate=False)
                         
                         # Resize to fit width if needed (max 450 pt wide approx)
-                        width, height = img.size
+                        width, height = self._image_size(img_bytes)
                         aspect = height / float(width)
                         display_width = 450
                         display_height = display_width * aspect
                         
-                        from reportlab.platypus import Image as RLImage
-                        # Re-open buffer for ReportLab
-                        img_buffer.seek(0)
-                        rl_img = RLImage(img_buffer, width=display_width, height=display_height)
-                        story.append(rl_img)
-                        story.append(Spacer(1, 0.2 * inch))
+                        rl_img = RLImage(BytesIO(img_bytes), width=display_width, height=display_height)
+                        append(rl_img)
+                        append(Spacer(1, 0.2 * inch))
                     except Exception as e:
                         print(f"Error processing image: {e}")
                 continue
 
+            text = block.get('text', '').strip()
             if not text:
                 continue
             
             # Clean HTML tags from text
-            text = self._clean_html(text)
-            
-            if block_type == 'h1':
-                story.append(Paragraph(text, self.styles['CustomH1']))
-            elif block_type == 'h2':
-                story.append(Paragraph(text, self.styles['CustomH2']))
-            elif block_type == 'h3':
-                story.append(Paragraph(text, self.styles['CustomH3']))
-            else:
-                story.append(Paragraph(text, self.styles['BodyText']))
-            
-            story.append(Spacer(1, 0.1 * inch))
+            append(Paragraph(clean(text), block_styles.get(block_type, body_style)))
+            append(Spacer(1, block_spacer))
         
         # Build PDF
         doc.build(story)
@@ -143,27 +193,18 @@ class ExportService:
         """
         markdown = []
         blocks = content.get('blocks', [])
+        append = markdown.append
+        clean = self._clean_html
+        prefixes = _MARKDOWN_PREFIXES
         
         for block in blocks:
-            block_type = block.get('type', 'p')
             text = block.get('text', '').strip()
             
             if not text:
                 continue
             
-            # Clean HTML tags
-            text = self._clean_html(text)
-            
-            if block_type == 'h1':
-                markdown.append(f'# {text}\n')
-            elif block_type == 'h2':
-                markdown.append(f'## {text}\n')
-            elif block_type == 'h3':
-                markdown.append(f'### {text}\n')
-            else:
-                markdown.append(f'{text}\n')
-            
-            markdown.append('\n')
+            # Clean HTML tags; one entry per block, blank line included
+            append(f"{prefixes.get(block.get('type', 'p'), '')}{clean(text)}\n\n")
         
         return ''.join(markdown)
     
@@ -178,6 +219,8 @@ class ExportService:
         Returns:
             str: HTML formatted text
         """
+        # Titles and block content are plain text, so escape them for HTML
+        title = escape(title)
         html = [f'''<!DOCTYPE html>
 <html lang="en">
 <head>
@@ -225,22 +268,20 @@ class ExportService:
 ''']
         
         blocks = content.get('blocks', [])
+        tags = _HTML_BLOCK_TAGS
+        paragraph = tags['p']
+        append = html.append
         
         for block in blocks:
-            block_type = block.get('type', 'p')
             content_html = block.get('content', '')
             
             if not content_html.strip():
                 continue
             
-            if block_type == 'h1':
-                html.append(f'    <h1>{content_html}</h1>\n')
-            elif block_type == 'h2':
-                html.append(f'    <h2>{content_html}</h2>\n')
-            elif block_type == 'h3':
-                html.append(f'    <h3>{content_html}</h3>\n')
-            else:
-                html.append(f'    <p>{content_html}</p>\n')
+            open_tag, close_tag = tags.get(block.get('type', 'p'), paragraph)
+            append(open_tag)
+            append(escape(content_html, quote=False))
+            append(close_tag)
         
         html.append('''</body>
 </html>''')
@@ -258,14 +299,20 @@ class ExportService:
             bytes: PNG image content
         """
         try:
-            # Remove data URL prefix if present
-            if ',' in canvas_data:
-                canvas_data = canvas_data.split(',')[1]
+            # Remove data URL prefix if present (find() is -1 without one,
+            # and slicing from 0 returns the string itself)
+            canvas_data = canvas_data[canvas_data.find(',') + 1:]
             
             # Decode base64
-            image_bytes = base64.b64decode(canvas_data)
+            image_bytes = b64.b64decode(canvas_data, validate=False)
+            
+            # Already a PNG: nothing to convert
+            if image_bytes[:8] == PNG_SIGNATURE:
+                return image_bytes
             
             # Open with PIL and save as PNG
+            from PIL import Image
+            
             image = Image.open(BytesIO(image_bytes))
             
             output = BytesIO()
@@ -279,14 +326,23 @@ class ExportService:
         except Exception as e:
             raise Exception(f'Failed to export canvas: {str(e)}')
     
+    def _image_size(self, img_bytes):
+        """Get image dimensions, reading them straight from the header for PNGs"""
+        if img_bytes[:8] == PNG_SIGNATURE and img_bytes[12:16] == b'IHDR':
+            return struct.unpack('>II', img_bytes[16:24])
+        
+        from PIL import Image
+        
+        with Image.open(BytesIO(img_bytes)) as img:
+            return img.size
+    
     def _clean_html(self, text):
         """Remove HTML tags from text"""
-        import re
+        # Plain text (what the editor normally sends) has no tags or entities
+        if '<' not in text and '&' not in text:
+            return text.strip()
         # Remove HTML tags
-        text = re.sub(r'<[^>]+>', '', text)
-        # Decode HTML entities
-        text = text.replace('&nbsp;', ' ')
-        text = text.replace('&lt;', '<')
-        text = text.replace('&gt;', '>')
-        text = text.replace('&amp;', '&')
+        text = _TAG_RE.sub('', text)
+        # Decode HTML entities (all named and numeric ones), keeping &nbsp; as a plain space
+        text = unescape(text).replace('\xa0', ' ')
         return text.strip()
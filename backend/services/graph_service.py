@@ -1,13 +1,86 @@
 import numpy as np
 import matplotlib
 matplotlib.use('Agg') # Non-interactive backend
-import matplotlib.pyplot as plt
 import io
-import base64
+import threading
+from functools import lru_cache
+from pybase64 import b64encode_as_string  # SIMD-accelerated, returns str directly
+
+
+# Professional teal palette
+_CHART_COLORS = (
+    'rgba(13, 148, 136, 0.7)',  # vibrant teal
+    'rgba(110, 231, 183, 0.7)', # mint accent
+    'rgba(51, 65, 85, 0.7)',    # charcoal
+    'rgba(204, 251, 241, 0.7)', # light teal
+    'rgba(15, 118, 110, 0.7)',  # dark teal
+)
+
+
+@lru_cache(maxsize=128)
+def _parse_series(raw_labels, raw_values):
+    """
+    Parse comma-separated labels/values and compute stats.
+    Memoized because the preview and plot calls usually send the same input.
+    Values are padded with zeros to the label count; labels are left for the
+    caller to pad with its own placeholder. Results are immutable so cached
+    entries can't be modified.
+    """
+    labels = [l for l in map(str.strip, raw_labels.split(',')) if l]
+    try:
+        # Let numpy do the float parsing in C
+        values = np.array([v for v in raw_values.split(',') if v.strip()], dtype=np.float64)
+    except ValueError:
+        values = np.empty(0)
+
+    # Ensure values cover every label
+    max_len = max(len(labels), values.size)
+    if values.size < max_len:
+        values = np.concatenate([values, np.zeros(max_len - values.size)])
+    values.setflags(write=False)
+
+    # Backend Logic: Calculate simple stats
+    if values.size:
+        total = float(values.sum())
+        stats = {
+            'sum': total,
+            'avg': total / values.size,
+            'max': float(values.max()),
+            'min': float(values.min())
+        }
+    else:
+        stats = {'sum': 0, 'avg': 0, 'max': 0, 'min': 0}
+
+    return tuple(labels), values, stats
+
 
 class GraphService:
-    def __init__(self):
-        pass
+    def __init__(self, dpi=96, png_compress_level=6):
+        # 96 dpi on a 10x6 figure is 960x576, plenty for an inline data URI
+        self.dpi = dpi
+        # Lower zlib levels encode a little faster but produce much larger images
+        self.png_compress_level = png_compress_level
+        # Figures are reused per thread instead of allocated for every plot
+        self._local = threading.local()
+
+    def _get_figure(self):
+        """
+        Return the calling thread's Figure
+        
+        Figures aren't thread-safe, so each thread gets its own through
+        threading.local; no lock is needed since nothing is shared.
+        """
+        fig = getattr(self._local, 'figure', None)
+        if fig is None:
+            # Imported on first plot; pulling in the figure machinery is
+            # most of matplotlib's import cost
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            from matplotlib.figure import Figure
+            
+            fig = Figure(figsize=(10, 6))
+            FigureCanvasAgg(fig)
+            self._local.figure = fig
+        return fig
 
     def process_chart_data(self, data):
         """
@@ -20,102 +93,87 @@ class GraphService:
         raw_values = data.get('values', '')
         chart_type = data.get('type', 'bar')
         
-        # Simple cleanup
-        labels = [l.strip() for l in raw_labels.split(',') if l.strip()]
-        try:
-            values = [float(v.strip()) for v in raw_values.split(',') if v.strip()]
-        except ValueError:
-            values = []
-
+        labels, values, stats = _parse_series(raw_labels, raw_values)
         # Ensure labels and values match length
-        max_len = max(len(labels), len(values))
-        labels = (labels + ["Label"] * max_len)[:max_len]
-        values = (values + [0] * max_len)[:max_len]
-
-        # Backend Logic: Calculate simple stats
-        stats = {
-            'sum': sum(values),
-            'avg': sum(values) / len(values) if values else 0,
-            'max': max(values) if values else 0,
-            'min': min(values) if values else 0
-        }
+        labels = list(labels) + ["Label"] * (values.size - len(labels))
 
         # Return data optimized for Chart.js
         return {
             'labels': labels,
             'datasets': [{
                 'label': data.get('title', 'Dataset'),
-                'data': values,
-                'backgroundColor': self._get_colors(chart_type, len(values)),
+                'data': values.tolist(),
+                'backgroundColor': self._get_colors(chart_type, values.size),
                 'borderColor': '#0d9488', # Vibrant Teal
                 'borderWidth': 1
             }],
-            'stats': stats
+            'stats': dict(stats)
         }
 
     def generate_matplotlib_plot(self, data):
         """
         Generate a graph using Matplotlib and return as base64 string.
         """
+        png, stats = self._render_plot(data)
+        img_str = b64encode_as_string(png)
+        
+        return {
+            'image': f'data:image/png;base64,{img_str}',
+            'stats': dict(stats)
+        }
+
+    def generate_matplotlib_plot_bytes(self, data):
+        """
+        Generate a graph using Matplotlib and return the raw PNG bytes.
+        Skips the base64 data URI for callers that serve the image directly.
+        """
+        png, _ = self._render_plot(data)
+        return png
+
+    def _render_plot(self, data):
+        """Render the plot to PNG, returning (png_bytes, stats)"""
         raw_labels = data.get('labels', '')
         raw_values = data.get('values', '')
         chart_type = data.get('type', 'bar')
         title = data.get('title', 'Data Plot')
         
-        labels = [l.strip() for l in raw_labels.split(',') if l.strip()]
-        try:
-            values = [float(v.strip()) for v in raw_values.split(',') if v.strip()]
-        except ValueError:
-            values = []
-
+        labels, values, stats = _parse_series(raw_labels, raw_values)
         # Ensure matching length
-        max_len = max(len(labels), len(values))
-        labels = (labels + [""] * (max_len - len(labels))) if len(labels) < max_len else labels
-        values = (values + [0] * (max_len - len(values))) if len(values) < max_len else values
+        labels = list(labels) + [""] * (values.size - len(labels))
 
-        plt.figure(figsize=(10, 6))
-        
-        # Consistent Teal Theme
-        color = '#0d9488' # StudioFlow Teal
-        
-        if chart_type == 'line':
-            plt.plot(labels, values, marker='o', color=color, linewidth=2, markersize=8)
-            plt.fill_between(labels, values, alpha=0.1, color=color)
-        elif chart_type == 'pie':
-            plt.pie(values, labels=labels, autopct='%1.1f%%', colors=['#0d9488', '#14b8a6', '#2dd4bf', '#5eead4', '#99f6e4'])
-        else: # bar
-            plt.bar(labels, values, color=color, alpha=0.8)
-
-        plt.title(title, fontsize=16, fontweight='bold', pad=20)
-        plt.tight_layout()
-        
-        # Save to buffer
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', dpi=150)
-        buf.seek(0)
-        img_str = base64.b64encode(buf.read()).decode('utf-8')
-        plt.close() # Clean up
+        fig = self._get_figure()
+        try:
+            ax = fig.add_subplot(111)
+            
+            # Consistent Teal Theme
+            color = '#0d9488' # StudioFlow Teal
+            
+            if chart_type == 'line':
+                ax.plot(labels, values, marker='o', color=color, linewidth=2, markersize=8)
+                ax.fill_between(labels, values, alpha=0.1, color=color)
+            elif chart_type == 'pie':
+                ax.pie(values, labels=labels, autopct='%1.1f%%', colors=['#0d9488', '#14b8a6', '#2dd4bf', '#5eead4', '#99f6e4'])
+            else: # bar
+                ax.bar(labels, values, color=color, alpha=0.8)
+
+            ax.set_title(title, fontsize=16, fontweight='bold', pad=20)
+            fig.tight_layout()
+            
+            # Save to buffer
+            buf = io.BytesIO()
+            fig.savefig(buf, format='png', dpi=self.dpi,
+                        pil_kwargs={'compress_level': self.png_compress_level})
+        finally:
+            fig.clf() # Clean up for the next plot
+            # clf() leaves a placeholder layout engine behind, which makes the
+            # next tight_layout() warn that the layout has changed
+            fig.set_layout_engine(None)
         
-        return {
-            'image': f'data:image/png;base64,{img_str}',
-            'stats': {
-                'sum': sum(values),
-                'avg': sum(values) / len(values) if values else 0,
-                'max': max(values) if values else 0,
-                'min': min(values) if values else 0
-            }
-        }
+        return buf.getvalue(), stats
 
     def _get_colors(self, chart_type, count):
-        # Professional teal palette
-        colors = [
-            'rgba(13, 148, 136, 0.7)',  # vibrant teal
-            'rgba(110, 231, 183, 0.7)', # mint accent
-            'rgba(51, 65, 85, 0.7)',    # charcoal
-            'rgba(204, 251, 241, 0.7)', # light teal
-            'rgba(15, 118, 110, 0.7)',  # dark teal
-        ]
         if chart_type == 'pie':
             # Cycle through colors if count > len(colors)
-            return [colors[i % len(colors)] for i in range(count)]
-        return colors[0] # Single color for bars/lines
+            repeats, remainder = divmod(count, len(_CHART_COLORS))
+            return list(_CHART_COLORS) * repeats + list(_CHART_COLORS[:remainder])
+        return _CHART_COLORS[0] # Single color for bars/lines
@@ -0,0 +1,7 @@
+"""
+WSGI entry point
+Used by production servers, e.g. `gunicorn wsgi:application`
+"""
+from app import app
+
+application = app
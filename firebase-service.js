@@ -213,6 +213,20 @@ class FirebaseService {
     // TEAM & COLLABORATION
     // ========================================================================
 
+    /**
+     * Key under which an email's invites are stored. Must match email_key in
+     * backend/app.py: '.' becomes ',' and the other characters RTDB rejects
+     * in keys (plus '%' itself) are percent-encoded. The invites read rule in
+     * README.md (Firebase Rules) must apply the same mapping
+     * @param {string} email 
+     * @returns {string}
+     */
+    emailKey(email) {
+        return email.replace(/[.%$#[\]\/]/g, (c) => c === '.'
+            ? ','
+            : '%' + c.charCodeAt(0).toString(16).toUpperCase());
+    }
+
     /**
      * Invite a user to a workspace
      * @param {string} workspaceId 
@@ -221,30 +235,34 @@ class FirebaseService {
     async inviteToWorkspace(workspaceId, email) {
         if (!this.currentUser) throw new Error('Not authenticated');
 
-        const safeEmail = email.replace(/\./g, ',');
+        const safeEmail = this.emailKey(email);
         const inviteId = this.db.ref().push().key;
 
         // Get workspace name
         const wsSnapshot = await this.db.ref(`workspaces/${workspaceId}/name`).once('value');
         const workspaceName = wsSnapshot.val() || 'Unnamed Workspace';
 
-        // Add invite to workspace
-        await this.db.ref(`workspaces/${workspaceId}/invites/${inviteId}`).set({
-            email: email,
-            status: 'pending',
-            invitedBy: this.currentUser.uid,
-            inviterEmail: this.currentUser.email,
-            timestamp: firebase.database.ServerValue.TIMESTAMP
-        });
-
-        // Add to global invites (indexed by email for target user to find)
-        await this.db.ref(`invites/${safeEmail}/${inviteId}`).set({
-            workspaceId: workspaceId,
-            workspaceName: workspaceName,
-            invitedBy: this.currentUser.uid,
-            inviterEmail: this.currentUser.email,
-            status: 'pending',
-            timestamp: firebase.database.ServerValue.TIMESTAMP
+        // Write both invite nodes in one atomic update; bumping updatedAt
+        // invalidates the backend's workspace ETag
+        await this.db.ref().update({
+            // Add invite to workspace
+            [`workspaces/${workspaceId}/invites/${inviteId}`]: {
+                email: email,
+                status: 'pending',
+                invitedBy: this.currentUser.uid,
+                inviterEmail: this.currentUser.email,
+                timestamp: firebase.database.ServerValue.TIMESTAMP
+            },
+            // Add to global invites (indexed by email for target user to find)
+            [`invites/${safeEmail}/${inviteId}`]: {
+                workspaceId: workspaceId,
+                workspaceName: workspaceName,
+                invitedBy: this.currentUser.uid,
+                inviterEmail: this.currentUser.email,
+                status: 'pending',
+                timestamp: firebase.database.ServerValue.TIMESTAMP
+            },
+            [`workspaces/${workspaceId}/updatedAt`]: firebase.database.ServerValue.TIMESTAMP
         });
 
         console.log('✅ Invite sent to:', email);
@@ -258,7 +276,7 @@ class FirebaseService {
     async getPendingInvites() {
         if (!this.currentUser || !this.currentUser.email) return [];
 
-        const safeEmail = this.currentUser.email.replace(/\./g, ',');
+        const safeEmail = this.emailKey(this.currentUser.email);
         const snapshot = await this.db.ref(`invites/${safeEmail}`).once('value');
         const invites = [];
 
@@ -287,24 +305,33 @@ class FirebaseService {
         if (!this.currentUser) throw new Error('Not authenticated');
 
         const uid = this.currentUser.uid;
-        const safeEmail = this.currentUser.email.replace(/\./g, ',');
+        const safeEmail = this.emailKey(this.currentUser.email);
+
+        const status = action === 'accept' ? 'accepted' : 'rejected';
+
+        // Update invite status; bumping updatedAt invalidates the backend's
+        // workspace ETag
+        const updates = {
+            [`workspaces/${workspaceId}/invites/${inviteId}/status`]: status,
+            [`invites/${safeEmail}/${inviteId}/status`]: status,
+            [`workspaces/${workspaceId}/updatedAt`]: firebase.database.ServerValue.TIMESTAMP
+        };
 
         if (action === 'accept') {
             // Add user as member
-            await this.db.ref(`workspaces/${workspaceId}/members/${uid}`).set('member');
+            updates[`workspaces/${workspaceId}/members/${uid}`] = 'member';
 
             // Add workspace to user's list
             const wsSnapshot = await this.db.ref(`workspaces/${workspaceId}/name`).once('value');
-            await this.db.ref(`users/${uid}/workspaces/${workspaceId}`).set({
+            updates[`users/${uid}/workspaces/${workspaceId}`] = {
                 name: wsSnapshot.val() || 'Workspace',
                 role: 'member',
                 joinedAt: firebase.database.ServerValue.TIMESTAMP
-            });
+            };
         }
 
-        // Update invite status
-        await this.db.ref(`workspaces/${workspaceId}/invites/${inviteId}/status`).set(action === 'accept' ? 'accepted' : 'rejected');
-        await this.db.ref(`invites/${safeEmail}/${inviteId}/status`).set(action === 'accept' ? 'accepted' : 'rejected');
+        // All paths are written in one atomic update
+        await this.db.ref().update(updates);
 
         console.log(`✅ Invite ${action}ed`);
     }
@@ -392,7 +419,7 @@ class FirebaseService {
     subscribeToNotifications(callback) {
         if (!this.currentUser || !this.currentUser.email) return;
 
-        const safeEmail = this.currentUser.email.replace(/\./g, ',');
+        const safeEmail = this.emailKey(this.currentUser.email);
         const ref = this.db.ref(`invites/${safeEmail}`);
 
         ref.on('value', async () => {